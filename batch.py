@@ -1,21 +1,48 @@
 import os
-import json
+import orjson
+import hashlib
+import diskcache
 import zipfile
 import tempfile
 import time
 import io
-import base64
+import pybase64
 import requests
-import gc
+from requests.adapters import HTTPAdapter
+import random
 import shutil
-from itertools import cycle
+import multiprocessing
 from datetime import datetime
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from threading import BoundedSemaphore, Lock, Thread
+from queue import Queue, LifoQueue, Empty, Full
 
-from pdf2image import convert_from_path, pdfinfo_from_path
+import pymupdf
+import numpy as np
 from PIL import Image
 
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    TJ = TurboJPEG()
+except Exception:  # PyTurboJPEG or libturbojpeg missing, fall back to Pillow
+    TJ = None
+
+try:
+    from isal import isal_zlib
+
+    _zlib_get_decompressor = zipfile._get_decompressor
+
+    def _get_decompressor(compress_type):
+        # ISA-L inflate for deflated members; stored members never hit a decompressor
+        if compress_type == zipfile.ZIP_DEFLATED:
+            return isal_zlib.decompressobj(-15)
+        return _zlib_get_decompressor(compress_type)
+
+    zipfile._get_decompressor = _get_decompressor
+except ImportError:  # isal not installed, keep stdlib zlib
+    pass
+
 ZIP_ROOT = Path(os.getenv("ZIP_ROOT", "zip"))
 OCR_ROOT = Path(os.getenv("OCR_ROOT", "ocr"))
 SERVICE = os.getenv("SERVICE", "ratchakitcha")
@@ -23,13 +50,113 @@ TARGET_YEAR = os.getenv("TARGET_YEAR")
 
 MAX_PAGES = 100
 IMAGE_DPI = 200
+MAX_DPI = 250
+VECTOR_DPI = 150
+MIN_TEXT_CHARS = 50
+MIN_TEXT_QUALITY = 0.8
+MAX_IMAGE_SIZE = 1500
+STREAM_MAX_BYTES = 256 * 1024 * 1024  # larger PDFs are spilled to a temp file
 OLLAMA_URLS = [
     "http://localhost:11434",
     "http://localhost:11435",
     "http://localhost:11436",
 ]
 OLLAMA_MODEL = "scb10x/typhoon-ocr1.5-3b"
-ollama_pool = cycle(OLLAMA_URLS)
+RENDER_BATCH = len(OLLAMA_URLS)
+NUM_PDF_WORKERS = int(os.getenv("NUM_PDF_WORKERS", "2"))
+
+OCR_SLOTS_PER_URL = int(os.getenv("OCR_SLOTS_PER_URL", "1"))
+OCR_CONCURRENCY = len(OLLAMA_URLS) * OCR_SLOTS_PER_URL
+MAX_RPS = float(os.getenv("MAX_RPS", "0"))  # 0 = unlimited
+# The limits above are totals; each of the NUM_PDF_WORKERS processes enforces its share
+PROC_MAX_RPS = MAX_RPS / NUM_PDF_WORKERS
+
+def proc_concurrency(worker: int) -> int:
+    # Spread the remainder over the first workers so the shares add up to OCR_CONCURRENCY
+    share = OCR_CONCURRENCY // NUM_PDF_WORKERS + (worker < OCR_CONCURRENCY % NUM_PDF_WORKERS)
+    return max(1, share)
+
+PROC_CONCURRENCY = proc_concurrency(0)  # set per worker in _init_pdf_worker
+ocr_slots = BoundedSemaphore(PROC_CONCURRENCY)
+# Requests in flight per endpoint; each request goes to the least-loaded one
+_inflight = {url: 0 for url in OLLAMA_URLS}
+_url_rank = {url: n for n, url in enumerate(OLLAMA_URLS)}  # tie-break, rotated per process
+_router_lock = Lock()
+
+# Pages per Ollama request; the model separates them with PAGE_BREAK
+OCR_BATCH_SIZE = int(os.getenv("OCR_BATCH_SIZE", "4"))
+PAGE_BREAK = "---PAGE_BREAK---"
+# Context and output budget per page; a request gets this times its image count
+PAGE_NUM_CTX = 4096
+PAGE_NUM_PREDICT = 1024
+OCR_OPTIONS = {"temperature": 0, "repeat_penalty": 1.1, "num_thread": 8}
+OCR_INSTRUCTION = (
+    "Extract all text from the image and format as Markdown.\n"
+    "- Tables: HTML <table>\n"
+    "- Output: Extracted content only."
+)
+
+MAX_RETRIES = 3
+RETRY_BASE_SEC = 1.0
+RETRY_MAX_SEC = 30.0
+RETRY_STATUS = (408, 425, 429, 500, 502, 503, 504)
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Keep-alive connections to every Ollama endpoint, shared by all OCR threads
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(
+    pool_connections=len(OLLAMA_URLS), pool_maxsize=OCR_CONCURRENCY, max_retries=0
+))
+
+# Page-level OCR results keyed by image hash; repeated cover pages skip Ollama
+PAGE_CACHE = diskcache.Cache(str(OCR_ROOT / "page_cache"))
+
+class BufferPool:
+    """Reusable BytesIO buffers for JPEG encoding; keeps at most max_free idle."""
+
+    def __init__(self, max_free: int):
+        self.free = LifoQueue(maxsize=max_free)
+
+    def acquire(self) -> io.BytesIO:
+        try:
+            buf = self.free.get_nowait()
+        except Empty:
+            return io.BytesIO()
+        # No truncate(): it would shrink the backing store; callers read up to tell()
+        buf.seek(0)
+        return buf
+
+    def release(self, buf: io.BytesIO):
+        try:
+            self.free.put_nowait(buf)
+        except Full:
+            buf.close()
+
+JPEG_POOL = BufferPool(32)
+
+class RateLimiter:
+    # Spaces request starts at least 1/rps apart across threads; rps <= 0 disables it
+    def __init__(self, rps: float):
+        self.min_interval = 1 / rps if rps > 0 else 0.0
+        self.lock = Lock()
+        self.next_at = 0.0
+
+    def acquire(self):
+        if not self.min_interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.min_interval
+        if wait > 0:
+            time.sleep(wait)
+
+limiter = RateLimiter(PROC_MAX_RPS)
+
+MANIFEST_TTL_SEC = 60
+_MANIFEST_CACHE = {}  # manifest path -> (loaded_at, manifest)
+_manifest_queue = Queue()
+_manifest_thread = None
 
 def cache_path(service: str, year: str, pdf_name: str) -> Path:
     p = OCR_ROOT / "cache" / service / year
@@ -41,130 +168,404 @@ def manifest_path(service: str, year: str) -> Path:
     p.mkdir(parents=True, exist_ok=True)
     return p / "manifest.json"
 
+def _manifest_writer():
+    while True:
+        path, data = _manifest_queue.get()
+        try:
+            # tmp + rename, so a crash mid-write never leaves a torn manifest
+            tmp = path.with_suffix(".json.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        except Exception as e:
+            print(f"[ERR] manifest write {path}: {e}")
+        finally:
+            _manifest_queue.task_done()
+
+def flush_manifests():
+    _manifest_queue.join()
+
 def load_manifest(service: str, year: str) -> dict:
     p = manifest_path(service, year)
+    hit = _MANIFEST_CACHE.get(p)
+    if hit and time.monotonic() - hit[0] < MANIFEST_TTL_SEC:
+        return hit[1]
+
+    flush_manifests()  # don't read behind a pending write
+    manifest = {"schema_version": 1, "generated_at": None, "zips": {}}
     if p.exists():
-        try: return json.loads(p.read_text(encoding="utf-8"))
+        try: manifest = orjson.loads(p.read_bytes())
         except: pass
-    return {"schema_version": 1, "generated_at": None, "zips": {}}
+    # In-memory index for O(1) lookups; never written to disk
+    for z in manifest["zips"].values():
+        z["_fileset"] = set(z["files"])
+    _MANIFEST_CACHE[p] = (time.monotonic(), manifest)
+    return manifest
+
+def manifest_bytes(manifest: dict) -> bytes:
+    zips = {
+        name: {k: v for k, v in z.items() if k != "_fileset"}
+        for name, z in manifest["zips"].items()
+    }
+    return orjson.dumps({**manifest, "zips": zips}, option=orjson.OPT_INDENT_2)
 
 def save_manifest(service: str, year: str, manifest: dict):
+    global _manifest_thread
     manifest["generated_at"] = datetime.utcnow().isoformat() + "Z"
-    manifest_path(service, year).write_text(
-        json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8"
+    p = manifest_path(service, year)
+    _MANIFEST_CACHE[p] = (time.monotonic(), manifest)
+    if _manifest_thread is None:
+        _manifest_thread = Thread(target=_manifest_writer, daemon=True)
+        _manifest_thread.start()
+    # Snapshot now, write to disk in the background
+    _manifest_queue.put((p, manifest_bytes(manifest)))
+
+def open_pdf(zipf, info, tmp: Path) -> pymupdf.Document:
+    if info.file_size <= STREAM_MAX_BYTES:
+        with zipf.open(info) as src:
+            return pymupdf.open(stream=src.read(), filetype="pdf")
+    tmp_pdf = tmp / Path(info.filename).name
+    with zipf.open(info) as src, open(tmp_pdf, "wb") as dst:
+        shutil.copyfileobj(src, dst, length=1 << 20)  # 1 MiB reads, not 64 KiB
+    return pymupdf.open(str(tmp_pdf))
+
+def text_layer(text: str) -> str:
+    # The page's embedded text, unless it is too short or mostly unprintable (broken font maps)
+    if len(text) <= MIN_TEXT_CHARS:
+        return ""
+    printable = sum(c.isprintable() or c.isspace() for c in text)
+    return text if printable / len(text) >= MIN_TEXT_QUALITY else ""
+
+def choose_dpi(page: pymupdf.Page) -> int:
+    # Render scans at their native resolution, vector-only pages at VECTOR_DPI
+    infos = page.get_image_info()
+    if not infos:
+        return VECTOR_DPI
+    if len(infos) > 1:
+        return IMAGE_DPI  # mixed content, keep the default
+    info = infos[0]
+    bbox = pymupdf.Rect(info["bbox"])
+    if abs(bbox) < 0.9 * abs(page.rect):
+        return IMAGE_DPI  # text with embedded figures, keep the default
+    native = max(info["width"], info["height"]) / max(bbox.width, bbox.height) * 72
+    # Floor at VECTOR_DPI: a low-res background can sit under vector text
+    return min(max(round(native), VECTOR_DPI), MAX_DPI)
+
+def embedded_jpeg(page: pymupdf.Page, text: str):
+    # Raw stream of a page that is just one upright baseline JPEG scan, else None.
+    # Text, vector drawings (redaction boxes), annotations and form fields drawn
+    # over the scan would be lost, so those pages are rendered instead.
+    if page.rotation or text or page.first_annot is not None or page.first_widget is not None:
+        return None
+    infos = page.get_image_info(xrefs=True)
+    if len(infos) != 1 or not infos[0]["xref"]:
+        return None
+    info = infos[0]
+    a, b, c, d, _, _ = info["transform"]
+    if b or c or a <= 0 or d <= 0 or abs(pymupdf.Rect(info["bbox"])) < 0.9 * abs(page.rect):
+        return None
+    doc, xref = page.parent, info["xref"]
+    if (
+        doc.xref_get_key(xref, "Filter") != ("name", "/DCTDecode")
+        or doc.xref_get_key(xref, "SMask")[0] != "null"
+        or doc.xref_get_key(xref, "Decode")[0] != "null"
+        or info["colorspace"] not in (1, 3)
+        or info["bpc"] != 8
+        or page.get_drawings()
+    ):
+        return None
+    return doc.xref_stream_raw(xref)
+
+def render_batch(doc: pymupdf.Document, first: int, last: int):
+    images = []
+    for i in range(first - 1, last):
+        page = doc.load_page(i)
+        raw_text = page.get_text("text").strip()
+        text = text_layer(raw_text)
+        if text:
+            images.append(text)  # no OCR needed for this page
+            continue
+        raw = embedded_jpeg(page, raw_text)
+        if raw is not None:
+            with Image.open(io.BytesIO(raw)) as jpg:  # header only
+                fits = max(jpg.size) <= MAX_IMAGE_SIZE
+            if fits:
+                images.append(raw)  # the scan's own JPEG goes out as-is
+                continue
+        # Render straight at the size OCR needs instead of downscaling afterwards
+        zoom = min(choose_dpi(page) / 72, MAX_IMAGE_SIZE / max(page.rect.width, page.rect.height))
+        pix = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom))
+        images.append(Image.frombytes("RGB", (pix.width, pix.height), pix.samples))
+    return images
+
+def acquire_endpoint() -> str:
+    with _router_lock:
+        url = min(_inflight, key=lambda u: (_inflight[u], _url_rank[u]))
+        _inflight[url] += 1
+        return url
+
+def release_endpoint(url: str):
+    with _router_lock:
+        _inflight[url] -= 1
+
+def _is_retriable(e: Exception) -> bool:
+    if isinstance(e, (requests.Timeout, requests.ConnectionError)):
+        return True
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        if e.response.status_code in RETRY_STATUS:
+            return True
+        body = e.response.text.lower()
+        return "rate limit" in body or "quota" in body
+    return False
+
+def _post_with_retry(url: str, json: dict, timeout: float) -> requests.Response:
+    body = orjson.dumps(json)
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            limiter.acquire()
+            r = SESSION.post(url, data=body, headers=JSON_HEADERS, timeout=timeout)
+            r.raise_for_status()
+            return r
+        except requests.RequestException as e:
+            if attempt == MAX_RETRIES or not _is_retriable(e):
+                raise
+            delay = min(RETRY_MAX_SEC, RETRY_BASE_SEC * 2 ** attempt) + random.uniform(0, RETRY_BASE_SEC)
+            print(f"\t [RETRY] {url} ({attempt+1}/{MAX_RETRIES}) in {delay:.1f}s: {e}")
+            time.sleep(delay)
+
+def encode_jpeg_b64(img: Image.Image, quality: int = 85) -> str:
+    if TJ is not None:
+        jpeg = TJ.encode(np.asarray(img), quality=quality, pixel_format=TJPF_RGB)
+        return pybase64.b64encode(jpeg).decode("ascii")
+
+    buf = JPEG_POOL.acquire()
+    try:
+        img.save(buf, format="JPEG", quality=quality)
+        with buf.getbuffer() as view:
+            return pybase64.b64encode(view[:buf.tell()]).decode("ascii")
+    finally:
+        JPEG_POOL.release(buf)
+
+def page_key(image_b64: bytes) -> bytes:
+    h = hashlib.blake2b(PAGE_KEY_PREFIX, digest_size=16)
+    h.update(image_b64)
+    return h.digest()
+
+def ocr_prompt(n: int) -> str:
+    if n == 1:
+        return f"<image>\n{OCR_INSTRUCTION}\n\nContent:"
+    return (
+        "<image>\n" * n
+        + f"Extract the text of EACH of the {n} images, in order, separated by a line "
+        + f"containing only {PAGE_BREAK}.\n{OCR_INSTRUCTION}\n\nContent:"
     )
 
-def ocr_worker(img_idx_tuple):
-    img, idx, total = img_idx_tuple
-    base_url = next(ollama_pool)
-    api_url = f"{base_url}/api/generate"
-    
-    t0 = time.perf_counter()
-    
-    # Pre-process
-    if max(img.size) > 1500:
-        img.thumbnail((1500, 1500), Image.Resampling.LANCZOS)
-    if img.mode != "RGB":
-        img = img.convert("RGB")
-
-    buf = io.BytesIO()
-    img.save(buf, format="JPEG", quality=85)
-    encoded_image = base64.b64encode(buf.getvalue()).decode()
-    buf.close()
+# Model, instruction and options all shape the output, so all of them key the
+# shared page cache (num_ctx and num_predict per page, as scaled in ocr_request)
+PAGE_KEY_PREFIX = orjson.dumps({
+    "model": OLLAMA_MODEL,
+    "prompt": ocr_prompt(1),
+    "page_break": PAGE_BREAK,
+    "options": {**OCR_OPTIONS, "num_ctx": PAGE_NUM_CTX, "num_predict": PAGE_NUM_PREDICT},
+})
 
+def ocr_request(images_b64: list) -> str:
     payload = {
         "model": OLLAMA_MODEL,
-        "prompt": "<image>\nExtract all text from the image and format as Markdown.\n- Tables: HTML <table>\n- Output: Extracted content only.\n\nContent:",
-        "images": [encoded_image],
+        "prompt": ocr_prompt(len(images_b64)),
+        "images": images_b64,
         "stream": False,
+        # Sized to the request: a single page doesn't reserve a full batch's KV cache
+        # in each of the server's OLLAMA_NUM_PARALLEL slots
         "options": {
-            "temperature": 0,
-            "num_predict": 1024,
-            "num_ctx": 4096,
-            "repeat_penalty": 1.1,
-            "num_thread": 8
-        }
+            **OCR_OPTIONS,
+            "num_ctx": PAGE_NUM_CTX * len(images_b64),
+            "num_predict": PAGE_NUM_PREDICT * len(images_b64),
+        },
     }
+    base_url = acquire_endpoint()
+    try:
+        r = _post_with_retry(f"{base_url}/api/generate", json=payload, timeout=300 * len(images_b64))
+        return r.json().get("response", "").strip()
+    finally:
+        release_endpoint(base_url)
+
+def ocr_worker(batch: list, total: int) -> list:
+    # batch is [(img, idx), ...]; uncached pages go out in one request
+    t0 = time.perf_counter()
+    label = ", ".join(str(idx + 1) for _, idx in batch)
+
+    encoded = [
+        pybase64.b64encode(img).decode("ascii") if isinstance(img, bytes)
+        else encode_jpeg_b64(img if img.mode == "RGB" else img.convert("RGB"))
+        for img, _ in batch
+    ]
+    keys = [page_key(e.encode("ascii")) for e in encoded]
+    texts = [PAGE_CACHE.get(k) for k in keys]
+    miss = [n for n, t in enumerate(texts) if t is None]
 
     try:
-        r = requests.post(api_url, json=payload, timeout=300)
-        r.raise_for_status()
-        text = r.json().get("response", "").strip()
+        if miss:
+            out = ocr_request([encoded[n] for n in miss])
+            parts = [out] if len(miss) == 1 else [p.strip() for p in out.split(PAGE_BREAK)]
+            if len(parts) != len(miss):
+                # Separator dropped or repeated; page boundaries are unknown, redo singly
+                print(f"\t [BATCH] {len(parts)} parts for {len(miss)} pages, retrying one by one")
+                parts = [ocr_request([encoded[n]]) for n in miss]
+            for n, text in zip(miss, parts):
+                texts[n] = text
+                if text.strip():  # an empty reply may be transient; don't cache it for good
+                    PAGE_CACHE.set(keys[n], text)
         dt = time.perf_counter() - t0
-        print(f"\t ⏱ Page {idx+1}/{total} done in {dt:.2f}s")
-        return text
+        print(f"\t ⏱ Page {label}/{total} done in {dt:.2f}s")
+        return texts
     except Exception as e:
-        print(f"\t [ERR] Page {idx+1}: {e}")
-        return f"[Error: {e}]"
+        print(f"\t [ERR] Page {label}: {e}")
+        return [t if t is not None else f"[Error: {e}]" for t in texts]
+
+def submit_ocr(executor, batch: list, total: int):
+    ocr_slots.acquire()
+    f = executor.submit(ocr_worker, batch, total)
+    def done(_):
+        for img, _idx in batch:
+            if not isinstance(img, bytes):
+                img.close()
+        ocr_slots.release()
+    f.add_done_callback(done)
+    return [idx for _img, idx in batch], f
 
-def process_pdf_from_zip(zipf, info, service, year, zip_key, manifest):
+def process_pdf_from_zip(zipf, info, service, year):
     pdf_name = Path(info.filename).name
-    
-    if zip_key in manifest["zips"] and pdf_name in manifest["zips"][zip_key]["files"]:
-        return
     c_path = cache_path(service, year, pdf_name)
-    if c_path.exists(): return
 
     with tempfile.TemporaryDirectory() as tmp:
-        tmp_pdf = Path(tmp) / pdf_name
-        with zipf.open(info) as src, open(tmp_pdf, "wb") as dst:
-            shutil.copyfileobj(src, dst)
-
+        # One in-process document for the page count and every render batch
         try:
-            total_pages = int(pdfinfo_from_path(str(tmp_pdf))["Pages"])
+            doc = open_pdf(zipf, info, Path(tmp))
+            total_pages = doc.page_count
         except: return
 
-        if total_pages > MAX_PAGES: return
+        if total_pages > MAX_PAGES:
+            doc.close()
+            return
 
         print(f"[OCR] {pdf_name} ({total_pages} pages)")
         pdf_start = time.perf_counter()
-        
-        images = convert_from_path(str(tmp_pdf), dpi=IMAGE_DPI)
-        
-        worker_inputs = [(img, i, total_pages) for i, img in enumerate(images)]
-        
-        with ThreadPoolExecutor(max_workers=len(OLLAMA_URLS)) as executor:
-            texts = list(executor.map(ocr_worker, worker_inputs))
-
-        for img in images: img.close()
-        
+
+        batches = [
+            (s, min(s + RENDER_BATCH - 1, total_pages))
+            for s in range(1, total_pages + 1, RENDER_BATCH)
+        ]
+        texts = [""] * total_pages
+        futures = []
+        batch = []
+
+        # Render batch N+1 while batch N is being OCR'd; ocr_slots bounds requests in flight
+        with ThreadPoolExecutor(max_workers=1) as renderer, \
+             ThreadPoolExecutor(max_workers=PROC_CONCURRENCY) as executor:
+            pending = renderer.submit(render_batch, doc, *batches[0])
+            for n, (first, last) in enumerate(batches):
+                images = pending.result()
+                if n + 1 < len(batches):
+                    pending = renderer.submit(render_batch, doc, *batches[n + 1])
+                for i, img in enumerate(images):
+                    if isinstance(img, str):
+                        texts[first - 1 + i] = img
+                        continue
+                    batch.append((img, first - 1 + i))
+                    if len(batch) == OCR_BATCH_SIZE:
+                        futures.append(submit_ocr(executor, batch, total_pages))
+                        batch = []
+            if batch:  # flush the partial batch at the end of the PDF
+                futures.append(submit_ocr(executor, batch, total_pages))
+
+        doc.close()
+        ocr_pages = 0
+        for idxs, f in futures:
+            for idx, text in zip(idxs, f.result()):
+                texts[idx] = text
+            ocr_pages += len(idxs)
+        if ocr_pages < total_pages:
+            print(f"\t Text layer: {total_pages - ocr_pages}/{total_pages} pages")
+
         total_dt = time.perf_counter() - pdf_start
         avg_p = total_dt / total_pages
         print(f"  Finished {pdf_name} | Total: {total_dt:.2f}s | Avg: {avg_p:.2f}s/page")
 
         # Save Result
-        c_path.write_text(json.dumps({
+        c_path.write_bytes(orjson.dumps({
             "filename": pdf_name,
             "pages": total_pages,
             "text": "\n\n".join(texts),
             "time_sec": round(total_dt, 2)
-        }, ensure_ascii=False, indent=2), encoding="utf-8")
+        }, option=orjson.OPT_INDENT_2))
+
+        return pdf_name
+
+# Each worker process keeps its own handle on the zip being processed
+_worker_zipf = None
+
+def _init_pdf_worker(zip_path: Path, counter):
+    global _worker_zipf, PROC_CONCURRENCY, ocr_slots
+    _worker_zipf = zipfile.ZipFile(zip_path)
+    with counter.get_lock():
+        worker = counter.value % NUM_PDF_WORKERS
+        counter.value += 1
+    PROC_CONCURRENCY = proc_concurrency(worker)
+    ocr_slots = BoundedSemaphore(PROC_CONCURRENCY)
+    # Processes can't see each other's load; start each on a different endpoint
+    shift = worker % len(OLLAMA_URLS)
+    for n, url in enumerate(OLLAMA_URLS):
+        _url_rank[url] = (n - shift) % len(OLLAMA_URLS)
 
-        # Update Manifest
-        z = manifest["zips"].setdefault(zip_key, {"count": 0, "files": []})
-        if pdf_name not in z["files"]:
-            z["files"].append(pdf_name)
-            z["count"] = len(z["files"])
-        
-        gc.collect()
+def _pdf_worker(filename: str, service: str, year: str):
+    return process_pdf_from_zip(_worker_zipf, _worker_zipf.getinfo(filename), service, year)
 
 def process_zip(zip_path: Path, service: str):
     year = zip_path.stem
+    zip_key = zip_path.name
     manifest = load_manifest(service, year)
+    done = manifest["zips"].get(zip_key, {}).get("_fileset", set())
+
     with zipfile.ZipFile(zip_path) as z:
-        for info in z.infolist():
-            if not info.is_dir() and info.filename.lower().endswith(".pdf"):
-                process_pdf_from_zip(z, info, service, year, zip_path.name, manifest)
+        # Member order on disk, so the workers' reads walk the file sequentially
+        todo = [
+            info.filename for info in sorted(z.infolist(), key=lambda i: i.header_offset)
+            if not info.is_dir() and info.filename.lower().endswith(".pdf")
+            and Path(info.filename).name not in done
+            and not cache_path(service, year, Path(info.filename).name).exists()
+        ]
+
+    # PDFs run in parallel processes; only the parent touches the manifest
+    with ProcessPoolExecutor(
+        max_workers=NUM_PDF_WORKERS, initializer=_init_pdf_worker,
+        initargs=(zip_path, multiprocessing.Value("i", 0)),
+    ) as ex:
+        futures = {ex.submit(_pdf_worker, name, service, year): name for name in todo}
+        for f in as_completed(futures):
+            try:
+                pdf_name = f.result()
+            except Exception as e:
+                print(f"[ERR] {futures[f]}: {e}")
+                continue
+            if not pdf_name: continue
+            z = manifest["zips"].setdefault(zip_key, {"count": 0, "files": [], "_fileset": set()})
+            if pdf_name not in z["_fileset"]:
+                z["_fileset"].add(pdf_name)
+                z["files"].append(pdf_name)
+                z["count"] = len(z["files"])
     save_manifest(service, year, manifest)
 
 def main():
     service_dir = ZIP_ROOT / SERVICE
     if not service_dir.exists(): return
 
-    for z in sorted(service_dir.rglob("*.zip")):
-        if TARGET_YEAR and TARGET_YEAR not in str(z):
-            continue
-        process_zip(z, SERVICE)
+    try:
+        for z in sorted(service_dir.rglob("*.zip")):
+            if TARGET_YEAR and TARGET_YEAR not in str(z):
+                continue
+            process_zip(z, SERVICE)
+    finally:
+        flush_manifests()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
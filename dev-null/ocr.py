@@ -1,17 +1,23 @@
 import os
-import json
+import orjson
 import zipfile
 import tempfile
 import time
 import io
-import base64
+import binascii
+import gc
 import requests
-from itertools import cycle
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 from threading import Thread, Condition, Lock
 from collections import deque, defaultdict
 from pdf2image import convert_from_path, pdfinfo_from_path
 from PIL import Image
-import gc
+
+try:
+    import pyvips
+except (ImportError, OSError):  # pyvips or libvips missing, fall back to Pillow
+    pyvips = None
 
 ZIP_ROOT = os.getenv("ZIP_ROOT", "zip")
 OCR_ROOT = os.getenv("OCR_ROOT", "ocr")
@@ -26,10 +32,19 @@ BATCH_SIZE = 1
 BUFFER_MAX_PAGES = 10
 NUM_WORKERS = 3
 
-ollama_pool = cycle(OLLAMA_URLS)
 write_lock = Lock()
 pdf_start_times = {}
 
+def ollama_session(pool_size: int) -> requests.Session:
+    s = requests.Session()
+    s.mount("http://", HTTPAdapter(
+        pool_maxsize=pool_size, max_retries=Retry(total=2, backoff_factor=0.3)
+    ))
+    return s
+
+# One keep-alive connection pool per Ollama endpoint
+SESSIONS = {url: ollama_session(NUM_WORKERS) for url in OLLAMA_URLS}
+
 class PageBuffer:
     def __init__(self, max_pages: int):
         self.max_pages = max_pages
@@ -42,7 +57,7 @@ class PageBuffer:
             while self.pages >= self.max_pages:
                 self.cv.wait()
             self.buffer.append(item)
-            self.pages += len(item["images"])
+            self.pages += len(item["paths"])
             self.cv.notify_all()
 
     def get(self):
@@ -50,7 +65,7 @@ class PageBuffer:
             while not self.buffer:
                 self.cv.wait()
             item = self.buffer.popleft()
-            self.pages -= len(item["images"])
+            self.pages -= len(item["paths"])
             self.cv.notify_all()
             return item
 
@@ -66,8 +81,8 @@ def load_cache(year: str, filename: str):
     path = get_cache_path(year, filename)
     if os.path.exists(path):
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                return json.load(f)
+            with open(path, "rb") as f:
+                return orjson.loads(f.read())
         except:
             return None
     return None
@@ -79,8 +94,8 @@ def save_cache(year: str, filename: str, data: dict) -> bool:
         return False
     path = get_cache_path(year, filename)
     try:
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
         return True
     except Exception as e:
         print(f" [SAVE ERR] {filename}: {e}")
@@ -105,26 +120,46 @@ def safe_extract(zip_path: str, extract_dir: str) -> list[str]:
     except: pass
     return extracted
 
-def ocr_batch(images: list[Image.Image]) -> list[str]:
-    base_url = next(ollama_pool).rstrip('/')
-    api_url = f"{base_url}/api/generate"
+def encode_jpeg_b64(path: str, max_size: int, quality: int) -> bytes:
+    if pyvips is not None:
+        # Shrink-on-load: libjpeg-turbo decodes the page JPEG straight at the reduced scale
+        vimg = pyvips.Image.thumbnail(path, max_size, height=max_size, size="down")
+        data = vimg.jpegsave_buffer(Q=quality, optimize_coding=True, strip=True)
+    else:
+        with Image.open(path) as img:
+            if img.mode != 'RGB': img = img.convert('RGB')
+            if max(img.size) > max_size: img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+            buf = io.BytesIO()
+            img.save(buf, format="JPEG", quality=quality)
+        data = buf.getbuffer()
+    return binascii.b2a_base64(data, newline=False)
+
+
+def ollama_body(payload: dict, image_b64: bytes) -> bytes:
+    # splice the base64 image in as raw bytes so it never round-trips through str
+    body = orjson.dumps({**payload, "images": ["\0"]})
+    return body.replace(b'["\\u0000"]', b'["' + image_b64 + b'"]', 1)
+
+def ocr_batch(base_url: str, paths: list[str]) -> list[str]:
+    api_url = f"{base_url.rstrip('/')}/api/generate"
     sys_prompt = "Extract all text from the image and format as Markdown."
     results = []
-    for img in images:
-        if img.mode != 'RGB': img = img.convert('RGB')
-        if max(img.size) > 1120: img.thumbnail((1120, 1120), Image.Resampling.LANCZOS)
-        buf = io.BytesIO()
-        img.save(buf, format="JPEG", quality=90)
-        encoded = base64.b64encode(buf.getvalue()).decode()
+    for path in paths:
+        encoded = encode_jpeg_b64(path, max_size=1120, quality=90)
+        os.remove(path)
         payload = {
             "model": OLLAMA_MODEL,
             "prompt": f"<image>\n{sys_prompt}\n\nContent:", 
-            "images": [encoded],
             "stream": False,
             "options": {"temperature": 0, "num_predict": 4096}
         }
         try:
-            response = requests.post(api_url, json=payload, timeout=300)
+            response = SESSIONS[base_url].post(
+                api_url,
+                data=ollama_body(payload, encoded),
+                headers={"Content-Type": "application/json"},
+                timeout=300,
+            )
             response.raise_for_status()
             text = response.json().get("response", "").strip()
             results.append(text)
@@ -138,18 +173,25 @@ def pdf_producer(pdf_paths_with_pages: list, buffer: PageBuffer):
         name = os.path.basename(pdf_path)
         # print(f" [OCR START] {name} ({total_pages} pages)")
         try:
-            images = convert_from_path(pdf_path, dpi=150, thread_count=4)
-            ready_images = []
-            for img in images:
-                if max(img.size) > 1344: img.thumbnail((1344, 1344), Image.Resampling.LANCZOS)
-                ready_images.append(img)
-            for idx in range(0, len(ready_images), BATCH_SIZE):
-                batch = ready_images[idx : idx + BATCH_SIZE]
-                buffer.put({"pdf": name, "batch_index": idx // BATCH_SIZE, "images": batch, "total_pages": len(ready_images)})
+            # pdftoppm writes JPEGs straight to disk; only paths go through the buffer
+            page_dir = f"{pdf_path}.pages"
+            os.makedirs(page_dir, exist_ok=True)
+            paths = convert_from_path(
+                pdf_path,
+                dpi=150,
+                output_folder=page_dir,
+                fmt="jpeg",
+                jpegopt={"quality": 90},
+                paths_only=True,
+                thread_count=max(1, (os.cpu_count() or 2) // 2),
+            )
+            for idx in range(0, len(paths), BATCH_SIZE):
+                batch = paths[idx : idx + BATCH_SIZE]
+                buffer.put({"pdf": name, "batch_index": idx // BATCH_SIZE, "paths": batch, "total_pages": len(paths)})
         except Exception as e:
             print(f" [PRODUCER ERR] {name}: {e}")
 
-def ocr_consumer(buffer: PageBuffer, results: dict, year: str):
+def ocr_consumer(buffer: PageBuffer, results: dict, year: str, base_url: str):
     while True:
         item = buffer.get()
         pdf = item["pdf"]
@@ -157,7 +199,7 @@ def ocr_consumer(buffer: PageBuffer, results: dict, year: str):
         total_pages = item["total_pages"]
 
         try:
-            texts = ocr_batch(item["images"])
+            texts = ocr_batch(base_url, item["paths"])
             if texts and texts[0]:
                 text_result = texts[0]
 
@@ -179,7 +221,6 @@ def ocr_consumer(buffer: PageBuffer, results: dict, year: str):
                         }
                         if save_cache(year, pdf, full_data):
                             print(f" [DONE & SAVED] {pdf}")
-            item["images"] = None
             gc.collect()
 
         except Exception as e:
@@ -211,7 +252,7 @@ def process_zip(zip_path: str, year: str):
             buffer = PageBuffer(BUFFER_MAX_PAGES)
             total_target = len(results) + len(to_process)
             producer = Thread(target=pdf_producer, args=(to_process, buffer), daemon=True)
-            consumers = [Thread(target=ocr_consumer, args=(buffer, results, year), daemon=True) for _ in range(NUM_WORKERS)]
+            consumers = [Thread(target=ocr_consumer, args=(buffer, results, year, OLLAMA_URLS[i % len(OLLAMA_URLS)]), daemon=True) for i in range(NUM_WORKERS)]
             producer.start()
             for c in consumers: c.start()
             producer.join()
@@ -221,8 +262,8 @@ def process_zip(zip_path: str, year: str):
         summary_dir = os.path.join(OCR_ROOT, SERVICE, year)
         os.makedirs(summary_dir, exist_ok=True)
         out_file = os.path.join(summary_dir, f"{month}.json")
-        with open(out_file, "w", encoding="utf-8") as f:
-            json.dump({"year": year, "month": month, "files": final_list}, f, ensure_ascii=False, indent=2)
+        with open(out_file, "wb") as f:
+            f.write(orjson.dumps({"year": year, "month": month, "files": final_list}, option=orjson.OPT_INDENT_2))
 
 def main():
     if not os.path.exists(ZIP_ROOT): return
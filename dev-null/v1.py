@@ -1,11 +1,13 @@
 import os
-import json
+import orjson
 import zipfile
 import tempfile
 import time
 import io
 import base64
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 from pdf2image import convert_from_path, pdfinfo_from_path
 from PIL import Image
 import gc
@@ -24,6 +26,19 @@ ollama_pool = cycle(OLLAMA_URLS)
 MAX_PAGES = 100
 IMAGE_DPI = 200 
 
+def ollama_session(pool_size: int) -> requests.Session:
+    s = requests.Session()
+    s.mount("http://", HTTPAdapter(
+        pool_maxsize=pool_size,
+        max_retries=Retry(
+            total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=None
+        ),
+    ))
+    return s
+
+# One keep-alive connection pool per Ollama endpoint
+SESSIONS = {url: ollama_session(1) for url in OLLAMA_URLS}
+
 def get_cache_path(year: str, filename: str) -> str:
     cache_dir = os.path.join(OCR_ROOT, SERVICE, "_cache", year)
     os.makedirs(cache_dir, exist_ok=True)
@@ -33,15 +48,15 @@ def load_cache(year: str, filename: str):
     path = get_cache_path(year, filename)
     if os.path.exists(path):
         try:
-            with open(path, "r", encoding="utf-8") as f:
-                return json.load(f)
+            with open(path, "rb") as f:
+                return orjson.loads(f.read())
         except: return None
     return None
 
 def save_cache(year: str, filename: str, data: dict):
     path = get_cache_path(year, filename)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
+    with open(path, "wb") as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
 
 def ocr_single_image(img: Image.Image) -> str:
     """Refactored from ocr_batch to handle single images sequentially"""
@@ -77,7 +92,7 @@ def ocr_single_image(img: Image.Image) -> str:
         }
     }
     try:
-        response = requests.post(api_url, json=payload, timeout=180)
+        response = SESSIONS[base_url].post(api_url, json=payload, timeout=(5, 180))
         response.raise_for_status()
         res_json = response.json()
         text = res_json.get("response", "").strip()
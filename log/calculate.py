@@ -1,27 +1,27 @@
+import os
 import re
-import statistics
+import mmap
+import numpy as np
 
 log_file = "ollama.log"
 
-times = []
+TIME_RE = re.compile(rb"\|\s*([\d\.]+)s\s*\|")
 
-with open(log_file, "r", encoding="utf-8", errors="ignore") as f:
-    for line in f:
-        m = re.search(r"\|\s*([\d\.]+)s\s*\|", line)
-        if m:
-            times.append(float(m.group(1)))
+times = np.empty(0, dtype=np.float64)
 
-if not times:
+if os.path.getsize(log_file):
+    with open(log_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        times = np.array(TIME_RE.findall(buf), dtype=np.float64)
+
+if not times.size:
     print("not found log in this time")
     exit()
 
-times.sort()
-
-avg = statistics.mean(times)
-p95 = times[int(len(times) * 0.95) - 1]
+avg = times.mean()
+p95 = np.percentile(times, 95)
 
-print(f"num request     : {len(times)}")
+print(f"num request     : {times.size}")
 print(f"avg             : {avg:.3f} s")
-print(f"min             : {min(times):.3f} s")
-print(f"max             : {max(times):.3f} s")
+print(f"min             : {times.min():.3f} s")
+print(f"max             : {times.max():.3f} s")
 print(f"p95             : {p95:.3f} s")
@@ -1,19 +1,29 @@
 import os
-import json
+import orjson
+import hashlib
+import diskcache
 import zipfile
 import tempfile
 import time
 import io
-import base64
+import binascii
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 import gc
-from itertools import cycle
 from datetime import datetime
 from pathlib import Path
+from queue import Queue
+from threading import Lock, Thread
 
-from pdf2image import convert_from_path, pdfinfo_from_path
+import pymupdf
 from PIL import Image
 
+try:
+    import pyvips
+except (ImportError, OSError):  # pyvips or libvips missing, fall back to Pillow
+    pyvips = None
+
 ZIP_ROOT = Path(os.getenv("ZIP_ROOT", "zip"))
 OCR_ROOT = Path(os.getenv("OCR_ROOT", "ocr"))
 TARGET_YEAR = os.getenv("TARGET_YEAR")
@@ -21,10 +31,35 @@ SERVICE = os.getenv("SERVICE", "ratchakitcha")
 
 MAX_PAGES = 100
 IMAGE_DPI = 200
+MAX_IMAGE_SIZE = 1120
+MAX_DPI = 250
+VECTOR_DPI = 150
+MIN_TEXT_CHARS = 50
+MIN_TEXT_QUALITY = 0.8
 
 OLLAMA_URLS = ["http://localhost:11434"]
 OLLAMA_MODEL = "scb10x/typhoon-ocr1.5-3b"
-ollama_pool = cycle(OLLAMA_URLS)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Requests in flight per endpoint; each page goes to the least-loaded one
+_inflight = {url: 0 for url in OLLAMA_URLS}
+_router_lock = Lock()
+# Rendered pages waiting for OCR; bounds memory while rendering runs ahead
+PAGE_QUEUE_SIZE = 4
+
+def ollama_session(pool_size: int) -> requests.Session:
+    s = requests.Session()
+    s.mount("http://", HTTPAdapter(
+        pool_maxsize=pool_size, max_retries=Retry(total=2, backoff_factor=0.3)
+    ))
+    return s
+
+
+# One keep-alive connection pool per Ollama endpoint
+SESSIONS = {url: ollama_session(1) for url in OLLAMA_URLS}
+
+# Page-level OCR results keyed by image hash; repeated cover pages skip Ollama
+PAGE_CACHE = diskcache.Cache(str(OCR_ROOT / "page_cache"))
+
 
 def buddhist_to_ad(year: str) -> str:
     y = int(year)
@@ -47,83 +82,254 @@ def manifest_path(service: str, year: str) -> Path:
     return p / "manifest.json"
 
 
+def manifest_log_path(service: str, year: str) -> Path:
+    # Append-only journal of manifest additions, folded into manifest.json on save
+    return manifest_path(service, year).with_suffix(".jsonl")
+
+
 def load_manifest(service: str, year: str) -> dict:
     path = manifest_path(service, year)
     if path.exists():
-        return json.loads(path.read_text(encoding="utf-8"))
-
-    return {
-        "schema_version": 1,
-        "generated_at": None,
-        "zips": {}
+        manifest = orjson.loads(path.read_bytes())
+    else:
+        manifest = {
+            "schema_version": 1,
+            "generated_at": None,
+            "zips": {}
+        }
+
+    # In-memory index for O(1) lookups; never written to disk
+    for z in manifest["zips"].values():
+        z["_fileset"] = set(z["files"])
+    log = manifest_log_path(service, year)
+    if log.exists():
+        for line in log.read_bytes().splitlines():
+            try:
+                rec = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                continue  # torn write from an interrupted run
+            _add_manifest_entry(manifest, rec["zip"], rec["pdf"])
+    return manifest
+
+
+def manifest_bytes(manifest: dict) -> bytes:
+    zips = {
+        name: {k: v for k, v in z.items() if k != "_fileset"}
+        for name, z in manifest["zips"].items()
     }
+    return orjson.dumps({**manifest, "zips": zips}, option=orjson.OPT_INDENT_2)
 
 
 def save_manifest(service: str, year: str, manifest: dict):
     manifest["generated_at"] = datetime.utcnow().isoformat() + "Z"
-    manifest_path(service, year).write_text(
-        json.dumps(manifest, ensure_ascii=False, indent=2),
-        encoding="utf-8"
-    )
+    p = manifest_path(service, year)
+    tmp = p.with_suffix(".json.tmp")
+    tmp.write_bytes(manifest_bytes(manifest))
+    os.replace(tmp, p)
+    manifest_log_path(service, year).unlink(missing_ok=True)
 
 
 def in_manifest(manifest: dict, zip_name: str, pdf_name: str) -> bool:
     return (
         zip_name in manifest["zips"]
-        and pdf_name in manifest["zips"][zip_name]["files"]
+        and pdf_name in manifest["zips"][zip_name]["_fileset"]
     )
 
 
-def add_manifest(manifest: dict, zip_name: str, pdf_name: str):
-    z = manifest["zips"].setdefault(zip_name, {"count": 0, "files": []})
-    if pdf_name not in z["files"]:
-        z["files"].append(pdf_name)
-        z["count"] = len(z["files"])
+def _add_manifest_entry(manifest: dict, zip_name: str, pdf_name: str) -> bool:
+    z = manifest["zips"].setdefault(zip_name, {"count": 0, "files": [], "_fileset": set()})
+    if pdf_name in z["_fileset"]:
+        return False
+    z["_fileset"].add(pdf_name)
+    z["files"].append(pdf_name)
+    z["count"] = len(z["files"])
+    return True
+
+
+def add_manifest(manifest: dict, service: str, year: str, zip_name: str, pdf_name: str):
+    if not _add_manifest_entry(manifest, zip_name, pdf_name):
+        return
+    line = orjson.dumps({"zip": zip_name, "pdf": pdf_name}) + b"\n"
+    # O_APPEND keeps single small writes atomic on POSIX
+    fd = os.open(manifest_log_path(service, year), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
 
 def load_cache(service: str, year: str, pdf_name: str):
     p = cache_path(service, year, pdf_name)
     if not p.exists():
         return None
     try:
-        return json.loads(p.read_text(encoding="utf-8"))
+        return orjson.loads(p.read_bytes())
     except Exception:
         return None
 
 
 def save_cache(service: str, year: str, pdf_name: str, data: dict):
-    cache_path(service, year, pdf_name).write_text(
-        json.dumps(data, ensure_ascii=False, indent=2),
-        encoding="utf-8"
+    cache_path(service, year, pdf_name).write_bytes(
+        orjson.dumps(data, option=orjson.OPT_INDENT_2)
     )
 
-def ocr_single_image(img: Image.Image) -> str:
-    api_url = f"{next(ollama_pool)}/api/generate"
-
-    if max(img.size) > 1120:
-        img.thumbnail((1120, 1120), Image.Resampling.LANCZOS)
+def encode_jpeg_b64(img: Image.Image, max_size: int, quality: int) -> bytes:
     if img.mode != "RGB":
         img = img.convert("RGB")
-
-    buf = io.BytesIO()
-    img.save(buf, format="JPEG", quality=90)
-    encoded = base64.b64encode(buf.getvalue()).decode()
-    buf.close()
-
-    payload = {
-        "model": OLLAMA_MODEL,
-        "prompt": "<image>\nExtract all text and return only content.",
-        "images": [encoded],
-        "stream": False,
-        "options": {"temperature": 0, "num_predict": 4096},
-    }
-
+    if pyvips is not None:
+        # libvips resize + libjpeg-turbo encode, no Pillow LANCZOS pass
+        vimg = pyvips.Image.new_from_memory(img.tobytes(), img.width, img.height, 3, "uchar")
+        if max(img.size) > max_size:
+            vimg = vimg.thumbnail_image(max_size, height=max_size)
+        data = vimg.jpegsave_buffer(Q=quality, optimize_coding=True, strip=True)
+    else:
+        if max(img.size) > max_size:
+            img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=quality)
+        data = buf.getbuffer()
+    return binascii.b2a_base64(data, newline=False)
+
+
+def ollama_body(payload: dict, image_b64: bytes) -> bytes:
+    # splice the base64 image in as raw bytes so it never round-trips through str
+    body = orjson.dumps({**payload, "images": ["\0"]})
+    return body.replace(b'["\\u0000"]', b'["' + image_b64 + b'"]', 1)
+
+def page_key(image_b64: bytes) -> bytes:
+    h = hashlib.blake2b(PAGE_KEY_PREFIX, digest_size=16)
+    h.update(image_b64)
+    return h.digest()
+
+# Static part of every OCR request; only the image changes per page
+OCR_PAYLOAD = {
+    "model": OLLAMA_MODEL,
+    "prompt": "<image>\nExtract all text and return only content.",
+    "stream": False,
+    "keep_alive": OLLAMA_KEEP_ALIVE,
+    "options": {"temperature": 0, "num_predict": 4096},
+}
+
+# Model, prompt and options all shape the output, so all of them key the shared page cache
+PAGE_KEY_PREFIX = orjson.dumps({k: OCR_PAYLOAD[k] for k in ("model", "prompt", "options")})
+
+def acquire_endpoint() -> str:
+    with _router_lock:
+        url = min(_inflight, key=_inflight.get)
+        _inflight[url] += 1
+        return url
+
+def release_endpoint(url: str):
+    with _router_lock:
+        _inflight[url] -= 1
+
+def ocr_single_image(img) -> str:
+    if isinstance(img, bytes):
+        encoded = binascii.b2a_base64(img, newline=False)
+    else:
+        encoded = encode_jpeg_b64(img, max_size=MAX_IMAGE_SIZE, quality=70)
+    key = page_key(encoded)
+    hit = PAGE_CACHE.get(key)
+    if hit is not None:
+        return hit
+
+    base_url = acquire_endpoint()
+    api_url = f"{base_url}/api/generate"
     try:
-        r = requests.post(api_url, json=payload, timeout=180)
+        r = SESSIONS[base_url].post(
+            api_url,
+            data=ollama_body(OCR_PAYLOAD, encoded),
+            headers={"Content-Type": "application/json"},
+            timeout=180
+        )
         r.raise_for_status()
-        return r.json().get("response", "").strip()
+        text = r.json().get("response", "").strip()
+        if text:  # an empty reply may be transient; don't cache it for good
+            PAGE_CACHE.set(key, text)
+        return text
     except Exception as e:
         print(f"[OCR ERR] {e}")
         return ""
+    finally:
+        release_endpoint(base_url)
+
+def text_layer(text: str) -> str:
+    # The page's embedded text, unless it is too short or mostly unprintable (broken font maps)
+    if len(text) <= MIN_TEXT_CHARS:
+        return ""
+    printable = sum(c.isprintable() or c.isspace() for c in text)
+    return text if printable / len(text) >= MIN_TEXT_QUALITY else ""
+
+def choose_dpi(page: pymupdf.Page) -> int:
+    # Render scans at their native resolution, vector-only pages at VECTOR_DPI
+    infos = page.get_image_info()
+    if not infos:
+        return VECTOR_DPI
+    if len(infos) > 1:
+        return IMAGE_DPI  # mixed content, keep the default
+    info = infos[0]
+    bbox = pymupdf.Rect(info["bbox"])
+    if abs(bbox) < 0.9 * abs(page.rect):
+        return IMAGE_DPI  # text with embedded figures, keep the default
+    native = max(info["width"], info["height"]) / max(bbox.width, bbox.height) * 72
+    # Floor at VECTOR_DPI: a low-res background can sit under vector text
+    return min(max(round(native), VECTOR_DPI), MAX_DPI)
+
+def embedded_jpeg(page: pymupdf.Page, text: str):
+    # Raw stream of a page that is just one upright baseline JPEG scan, else None.
+    # Text, vector drawings (redaction boxes), annotations and form fields drawn
+    # over the scan would be lost, so those pages are rendered instead.
+    if page.rotation or text or page.first_annot is not None or page.first_widget is not None:
+        return None
+    infos = page.get_image_info(xrefs=True)
+    if len(infos) != 1 or not infos[0]["xref"]:
+        return None
+    info = infos[0]
+    a, b, c, d, _, _ = info["transform"]
+    if b or c or a <= 0 or d <= 0 or abs(pymupdf.Rect(info["bbox"])) < 0.9 * abs(page.rect):
+        return None
+    doc, xref = page.parent, info["xref"]
+    if (
+        doc.xref_get_key(xref, "Filter") != ("name", "/DCTDecode")
+        or doc.xref_get_key(xref, "SMask")[0] != "null"
+        or doc.xref_get_key(xref, "Decode")[0] != "null"
+        or info["colorspace"] not in (1, 3)
+        or info["bpc"] != 8
+        or page.get_drawings()
+    ):
+        return None
+    return doc.xref_stream_raw(xref)
+
+def page_image(page: pymupdf.Page, text: str):
+    # Scanned pages skip rendering: their JPEG goes out as-is when small enough,
+    # otherwise it is decoded at a reduced DCT scale. Everything else is rendered.
+    raw = embedded_jpeg(page, text)
+    if raw is not None:
+        img = Image.open(io.BytesIO(raw))
+        if max(img.size) <= MAX_IMAGE_SIZE:
+            img.close()
+            return raw
+        scale = MAX_IMAGE_SIZE / max(img.size)
+        img.draft(img.mode, (round(img.width * scale), round(img.height * scale)))
+        return img
+    pix = page.get_pixmap(dpi=choose_dpi(page), alpha=False)
+    return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+def ocr_consumer(pages: Queue, texts: list):
+    while True:
+        item = pages.get()
+        if item is None:
+            return
+        idx, img = item
+        try:
+            texts[idx] = ocr_single_image(img)
+        except Exception as e:
+            # Keep consuming; a dead consumer would leave the renderer blocked on put()
+            print(f"[OCR ERR] page {idx+1}: {e}")
+            texts[idx] = ""
+        finally:
+            if not isinstance(img, bytes):
+                img.close()
+
 
 def process_pdf(
     pdf_path: Path,
@@ -138,34 +344,46 @@ def process_pdf(
         return
 
     if load_cache(service, year, pdf_name):
-        add_manifest(manifest, zip_key, pdf_name)
+        add_manifest(manifest, service, year, zip_key, pdf_name)
         return
 
-    info = pdfinfo_from_path(str(pdf_path))
-    total_pages = int(info["Pages"])
+    doc = pymupdf.open(str(pdf_path))
+    total_pages = doc.page_count
 
     if total_pages > MAX_PAGES:
         print(f"[SKIP] {pdf_name} pages={total_pages}")
+        doc.close()
         return
 
     print(f"[OCR] {pdf_name} ({total_pages} pages)")
     start = time.perf_counter()
 
-    texts = []
-    for i in range(1, total_pages + 1):
-        images = convert_from_path(
-            str(pdf_path),
-            dpi=IMAGE_DPI,
-            first_page=i,
-            last_page=i
-        )
-        if images:
-            texts.append(ocr_single_image(images[0]))
-            images[0].close()
-            del images
-        gc.collect()
+    # Render the next pages while earlier ones are being OCR'd
+    texts = [""] * total_pages
+    from_text = 0
+    pages = Queue(maxsize=PAGE_QUEUE_SIZE)
+    consumers = [Thread(target=ocr_consumer, args=(pages, texts), daemon=True) for _ in OLLAMA_URLS]
+    for c in consumers:
+        c.start()
+    try:
+        with doc:
+            for i, page in enumerate(doc):
+                raw_text = page.get_text("text").strip()
+                text = text_layer(raw_text)
+                if text:
+                    texts[i] = text
+                    from_text += 1
+                    continue
+                pages.put((i, page_image(page, raw_text)))
+    finally:
+        for _ in consumers:
+            pages.put(None)
+        for c in consumers:
+            c.join()
 
     duration = round(time.perf_counter() - start, 2)
+    if from_text:
+        print(f"[TEXT] {pdf_name} {from_text}/{total_pages} pages from text layer")
 
     data = {
         "filename": pdf_name,
@@ -175,7 +393,7 @@ def process_pdf(
     }
 
     save_cache(service, year, pdf_name, data)
-    add_manifest(manifest, zip_key, pdf_name)
+    add_manifest(manifest, service, year, zip_key, pdf_name)
 
 
 def process_zip(zip_path: Path, service: str):
@@ -196,6 +414,7 @@ def process_zip(zip_path: Path, service: str):
             process_pdf(pdf, service, year, zip_key, manifest)
 
     save_manifest(service, year, manifest)
+    gc.collect()  # once per zip; page images are freed by refcounting
 
 def main():
     service_dir = ZIP_ROOT / SERVICE
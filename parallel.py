@@ -1,21 +1,31 @@
 import os
-import json
+import orjson
+import hashlib
+import diskcache
+import ijson
 import zipfile
-import tempfile
 import time
 import io
-import base64
+import binascii
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 import gc
-import shutil
-from itertools import cycle
+import sqlite3
 from datetime import datetime
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Full
+from threading import BoundedSemaphore, Lock, Thread
 
-from pdf2image import convert_from_path, pdfinfo_from_path
+import pymupdf
 from PIL import Image
 
+try:
+    import pyvips
+except (ImportError, OSError):  # pyvips or libvips missing, fall back to Pillow
+    pyvips = None
+
 
 ZIP_ROOT = Path(os.getenv("ZIP_ROOT", "zip"))
 OCR_ROOT = Path(os.getenv("OCR_ROOT", "ocr"))
@@ -24,33 +34,138 @@ TARGET_YEAR = os.getenv("TARGET_YEAR")
 
 MAX_PAGES = 250
 IMAGE_DPI = 200
+MAX_IMAGE_SIZE = 1024  # longest side sent to the model, as in tqdm.py
+MAX_DPI = 250
+VECTOR_DPI = 150
+MIN_TEXT_CHARS = 50
+MIN_TEXT_QUALITY = 0.8
 
 OLLAMA_URLS = ["http://localhost:11434", "http://localhost:11435"]
 OLLAMA_MODEL = "scb10x/typhoon-ocr1.5-3b"
-ollama_pool = cycle(OLLAMA_URLS)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+ENDPOINT_QUEUE_SIZE = 4
+# Concurrent requests per endpoint; match the server's OLLAMA_NUM_PARALLEL
+ENDPOINT_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))
+# Global cap on requests in flight and on request starts per second (0 = no cap)
+OCR_MAX_INFLIGHT = int(os.getenv("OCR_MAX_INFLIGHT", str(ENDPOINT_PARALLEL * len(OLLAMA_URLS))))
+OCR_MAX_RPS = float(os.getenv("OCR_MAX_RPS", "0"))
+
+DONE_DB_PATH = OCR_ROOT / "done.sqlite3"
+MANIFEST_READERS = 16
+done_db = None
+
+
+def ollama_session(pool_size: int) -> requests.Session:
+    s = requests.Session()
+    s.mount("http://", HTTPAdapter(
+        pool_maxsize=pool_size,
+        max_retries=Retry(
+            total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=None
+        ),
+    ))
+    return s
+
+
+# One keep-alive connection pool per Ollama endpoint, shared by its worker threads
+SESSIONS = {url: ollama_session(ENDPOINT_PARALLEL) for url in OLLAMA_URLS}
+
+# Page-level OCR results keyed by image hash; repeated cover pages skip Ollama
+PAGE_CACHE = diskcache.Cache(str(OCR_ROOT / "page_cache"))
+
 
-MAX_WORKERS = len(OLLAMA_URLS)
+class RateLimiter:
+    # Spaces request starts at least 1/rps apart across threads; rps <= 0 disables it
+    def __init__(self, rps: float):
+        self.min_interval = 1 / rps if rps > 0 else 0.0
+        self.lock = Lock()
+        self.next_at = 0.0
 
-GLOBAL_FINISHED_FILES = set()
+    def acquire(self):
+        if not self.min_interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.min_interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+INFLIGHT = BoundedSemaphore(OCR_MAX_INFLIGHT)
+limiter = RateLimiter(OCR_MAX_RPS)
+
+
+def iter_manifests(root):
+    # scandir walk: DirEntry caches the file type, so no stat() per node
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                yield from iter_manifests(entry.path)
+            elif entry.name == "manifest.json":
+                yield entry
+
+
+def manifest_files(path: str):
+    # Stream zips.*.files[] out of a manifest without building the whole dict
+    with open(path, "rb") as f:
+        for prefix, event, value in ijson.parse(f):
+            if event == "string" and prefix.startswith("zips.") and prefix.endswith(".files.item"):
+                yield value
+
+
+def read_manifest(entry):
+    try:
+        return entry, list(manifest_files(entry.path))
+    except Exception:
+        return entry, None
+
+
+def open_done_db() -> sqlite3.Connection:
+    DONE_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    db = sqlite3.connect(DONE_DB_PATH)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute("CREATE TABLE IF NOT EXISTS done (name TEXT PRIMARY KEY) WITHOUT ROWID")
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS manifests (path TEXT PRIMARY KEY, mtime_ns INTEGER) WITHOUT ROWID"
+    )
+    return db
 
 
 def load_all_manifests():
+    global done_db
     print("🔍 Scanning all manifests for existing work...")
-    count = 0
-    if not (OCR_ROOT / "json").exists():
-        return
-    for p in (OCR_ROOT / "json").rglob("manifest.json"):
-        try:
-            data = json.loads(p.read_text(encoding="utf-8"))
-            for zip_data in data.get("zips", {}).values():
-                for fname in zip_data.get("files", []):
-                    GLOBAL_FINISHED_FILES.add(fname)
-                    count += 1
-        except Exception:
-            pass
+    done_db = open_done_db()
+    if (OCR_ROOT / "json").exists():
+        # Only re-read manifests that changed since the last run
+        seen = dict(done_db.execute("SELECT path, mtime_ns FROM manifests"))
+        changed = [
+            e for e in iter_manifests(OCR_ROOT / "json")
+            if seen.get(e.path) != e.stat().st_mtime_ns
+        ]
+        # Parse in parallel; only this thread touches SQLite
+        with done_db, ThreadPoolExecutor(MANIFEST_READERS) as ex:
+            for entry, names in ex.map(read_manifest, changed):
+                if names is None:
+                    continue
+                done_db.executemany("INSERT OR IGNORE INTO done VALUES (?)", ((n,) for n in names))
+                done_db.execute(
+                    "INSERT OR REPLACE INTO manifests VALUES (?, ?)", (entry.path, entry.stat().st_mtime_ns)
+                )
+    count = done_db.execute("SELECT count(*) FROM done").fetchone()[0]
     print(f"Found {count} unique files in total manifests.\n")
 
 
+def is_done(pdf_name: str) -> bool:
+    return done_db.execute("SELECT 1 FROM done WHERE name = ?", (pdf_name,)).fetchone() is not None
+
+
+def mark_done(pdf_name: str):
+    with done_db:
+        done_db.execute("INSERT OR IGNORE INTO done VALUES (?)", (pdf_name,))
+
+
 def cache_path(service: str, year: str, pdf_name: str) -> Path:
     p = OCR_ROOT / "cache" / service / year
     p.mkdir(parents=True, exist_ok=True)
@@ -63,69 +178,296 @@ def manifest_path(service: str, year: str) -> Path:
     return p / "manifest.json"
 
 
+def manifest_log_path(service: str, year: str) -> Path:
+    return manifest_path(service, year).with_suffix(".jsonl")
+
+
+def hash_path(service: str, digest: str) -> Path:
+    p = OCR_ROOT / "cache" / service / "_hash"
+    p.mkdir(parents=True, exist_ok=True)
+    return p / f"{digest}.json"
+
+
+def copy_duplicate(service: str, digest: str, pdf_name: str, c_path: Path) -> bool:
+    # Byte-identical PDF already OCR'd under another name: reuse its result
+    try:
+        data = orjson.loads(hash_path(service, digest).read_bytes())
+    except (OSError, orjson.JSONDecodeError):
+        return False
+    data["filename"] = pdf_name
+    c_path.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    return True
+
+
+def link_hash(service: str, digest: str, c_path: Path):
+    h = hash_path(service, digest)
+    if not h.exists():
+        h.unlink(missing_ok=True)  # dangling link to a removed cache file
+        h.symlink_to(os.path.relpath(c_path, h.parent))
+
+
 def load_manifest(service: str, year: str) -> dict:
     p = manifest_path(service, year)
+    manifest = {"schema_version": 1, "generated_at": None, "zips": {}}
     if p.exists():
         try:
-            return json.loads(p.read_text(encoding="utf-8"))
+            manifest = orjson.loads(p.read_bytes())
         except Exception:
             pass
-    return {"schema_version": 1, "generated_at": None, "zips": {}}
+    # In-memory index for O(1) lookups; never written to disk
+    for z in manifest["zips"].values():
+        z["_fileset"] = set(z["files"])
+    # Replay PDFs finished since the last save
+    log = manifest_log_path(service, year)
+    if log.exists():
+        for line in log.read_bytes().splitlines():
+            try:
+                rec = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                continue  # torn write from an interrupted run
+            _add_manifest_entry(manifest, rec["zip"], rec["pdf"])
+    return manifest
+
+
+def manifest_bytes(manifest: dict) -> bytes:
+    zips = {
+        name: {k: v for k, v in z.items() if k != "_fileset"}
+        for name, z in manifest["zips"].items()
+    }
+    return orjson.dumps({**manifest, "zips": zips}, option=orjson.OPT_INDENT_2)
 
 
 def save_manifest(service: str, year: str, manifest: dict):
     manifest["generated_at"] = datetime.utcnow().isoformat() + "Z"
-    manifest_path(service, year).write_text(
-        json.dumps(manifest, ensure_ascii=False, indent=2),
-        encoding="utf-8",
-    )
+    p = manifest_path(service, year)
+    tmp = p.with_suffix(".json.tmp")
+    tmp.write_bytes(manifest_bytes(manifest))
+    os.replace(tmp, p)
+    manifest_log_path(service, year).unlink(missing_ok=True)
 
 
-def ocr_worker(args):
-    img, idx, total_pages = args
-    base_url = next(ollama_pool)
-    api_url = f"{base_url}/api/generate"
+def _add_manifest_entry(manifest: dict, zip_name: str, pdf_name: str) -> bool:
+    z = manifest["zips"].setdefault(zip_name, {"count": 0, "files": [], "_fileset": set()})
+    if pdf_name in z["_fileset"]:
+        return False
+    z["_fileset"].add(pdf_name)
+    z["files"].append(pdf_name)
+    z["count"] = len(z["files"])
+    return True
 
-    t_start = time.perf_counter()
 
-    if max(img.size) > 1500:
-        img.thumbnail((1500, 1500), Image.Resampling.LANCZOS)
+def add_manifest(manifest: dict, service: str, year: str, zip_name: str, pdf_name: str):
+    if not _add_manifest_entry(manifest, zip_name, pdf_name):
+        return
+    line = orjson.dumps({"zip": zip_name, "pdf": pdf_name}) + b"\n"
+    # O_APPEND keeps the small write atomic; fsync so a crash can't lose the PDF
+    fd = os.open(manifest_log_path(service, year), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def encode_jpeg_b64(img: Image.Image, max_size: int, quality: int) -> bytes:
     if img.mode != "RGB":
         img = img.convert("RGB")
+    if pyvips is not None:
+        # libvips resize + libjpeg-turbo encode, no Pillow LANCZOS pass
+        vimg = pyvips.Image.new_from_memory(img.tobytes(), img.width, img.height, 3, "uchar")
+        if max(img.size) > max_size:
+            vimg = vimg.thumbnail_image(max_size, height=max_size)
+        data = vimg.jpegsave_buffer(Q=quality, optimize_coding=True, strip=True)
+    else:
+        if max(img.size) > max_size:
+            img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=quality)
+        data = buf.getbuffer()
+    return binascii.b2a_base64(data, newline=False)
+
+
+def ollama_body(payload: dict, image_b64: bytes) -> bytes:
+    # splice the base64 image in as raw bytes so it never round-trips through str
+    body = orjson.dumps({**payload, "images": ["\0"]})
+    return body.replace(b'["\\u0000"]', b'["' + image_b64 + b'"]', 1)
+
+
+def page_key(image_b64: bytes) -> bytes:
+    h = hashlib.blake2b(PAGE_KEY_PREFIX, digest_size=16)
+    h.update(image_b64)
+    return h.digest()
+
+
+# Static part of every OCR request; only the image changes per page
+OCR_PAYLOAD = {
+    "model": OLLAMA_MODEL,
+    "prompt": "<image>\nExtract all text from the image and format as Markdown.\n"
+              "- Tables: HTML <table>\n"
+              "- Output: Extracted content only.\n\n"
+              "Content:",
+    "stream": False,
+    "keep_alive": OLLAMA_KEEP_ALIVE,
+    "options": {
+        "temperature": 0,
+        "num_predict": 1024,
+        "num_ctx": 4096,
+    },
+}
+
+# Model, prompt and options all shape the output, so all of them key the shared page cache
+PAGE_KEY_PREFIX = orjson.dumps({k: OCR_PAYLOAD[k] for k in ("model", "prompt", "options")})
+
+
+def ocr_worker(base_url: str, args):
+    img, idx, total_pages = args
+    api_url = f"{base_url}/api/generate"
 
-    buf = io.BytesIO()
-    img.save(buf, format="JPEG", quality=85)
-    encoded_image = base64.b64encode(buf.getvalue()).decode()
-    buf.close()
-
-    payload = {
-        "model": OLLAMA_MODEL,
-        "prompt": "<image>\nExtract all text from the image and format as Markdown.\n"
-                  "- Tables: HTML <table>\n"
-                  "- Output: Extracted content only.\n\n"
-                  "Content:",
-        "images": [encoded_image],
-        "stream": False,
-        "options": {
-            "temperature": 0,
-            "num_predict": 1024,
-            "num_ctx": 4096,
-        },
-    }
+    t_start = time.perf_counter()
 
-    r = requests.post(api_url, json=payload, timeout=300)
+    if isinstance(img, bytes):
+        encoded_image = binascii.b2a_base64(img, newline=False)
+    else:
+        with img:  # release the raster as soon as it is encoded
+            encoded_image = encode_jpeg_b64(img, max_size=MAX_IMAGE_SIZE, quality=70)
+    key = page_key(encoded_image)
+    hit = PAGE_CACHE.get(key)
+    if hit is not None:
+        return idx, hit, time.perf_counter() - t_start
+
+    with INFLIGHT:
+        limiter.acquire()
+        r = SESSIONS[base_url].post(
+            api_url,
+            data=ollama_body(OCR_PAYLOAD, encoded_image),
+            headers={"Content-Type": "application/json"},
+            timeout=(5, 300),
+        )
     r.raise_for_status()
 
     text = r.json().get("response", "").strip()
+    if text:  # an empty reply may be transient; don't cache it for good
+        PAGE_CACHE.set(key, text)
     t_delta = time.perf_counter() - t_start
 
     return idx, text, t_delta
 
 
+def submit_page(queues: list, task, turn: int):
+    # Round-robin, but spill to the next endpoint when this one's queue is full
+    for k in range(len(queues)):
+        try:
+            queues[(turn + k) % len(queues)].put_nowait(task)
+            return
+        except Full:
+            pass
+    queues[turn % len(queues)].put(task)
+
+
+def endpoint_worker(url: str, q: Queue, results: Queue):
+    # Worker thread bound to one Ollama endpoint and its session for life
+    while True:
+        task = q.get()
+        if task is None:
+            return
+        try:
+            results.put(ocr_worker(url, task))
+        except Exception as e:
+            results.put(e)
+
+
+def start_endpoint_workers(results: Queue):
+    queues, threads = [], []
+    for url in OLLAMA_URLS:
+        q = Queue(maxsize=ENDPOINT_QUEUE_SIZE)
+        for _ in range(ENDPOINT_PARALLEL):
+            t = Thread(target=endpoint_worker, args=(url, q, results), daemon=True)
+            t.start()
+            threads.append(t)
+        queues.append(q)
+    return queues, threads
+
+
+def stop_endpoint_workers(queues: list, threads: list):
+    for q in queues:
+        for _ in range(ENDPOINT_PARALLEL):
+            q.put(None)
+    for t in threads:
+        t.join()
+
+
+def text_layer(text: str) -> str:
+    # The page's embedded text, unless it is too short or mostly unprintable (broken font maps)
+    if len(text) <= MIN_TEXT_CHARS:
+        return ""
+    printable = sum(c.isprintable() or c.isspace() for c in text)
+    return text if printable / len(text) >= MIN_TEXT_QUALITY else ""
+
+
+def choose_dpi(page: pymupdf.Page) -> int:
+    # Render scans at their native resolution, vector-only pages at VECTOR_DPI
+    infos = page.get_image_info()
+    if not infos:
+        return VECTOR_DPI
+    if len(infos) > 1:
+        return IMAGE_DPI  # mixed content, keep the default
+    info = infos[0]
+    bbox = pymupdf.Rect(info["bbox"])
+    if abs(bbox) < 0.9 * abs(page.rect):
+        return IMAGE_DPI  # text with embedded figures, keep the default
+    native = max(info["width"], info["height"]) / max(bbox.width, bbox.height) * 72
+    # Floor at VECTOR_DPI: a low-res background can sit under vector text
+    return min(max(round(native), VECTOR_DPI), MAX_DPI)
+
+
+def embedded_jpeg(page: pymupdf.Page, text: str):
+    # Raw stream of a page that is just one upright baseline JPEG scan, else None.
+    # Text, vector drawings (redaction boxes), annotations and form fields drawn
+    # over the scan would be lost, so those pages are rendered instead.
+    if page.rotation or text or page.first_annot is not None or page.first_widget is not None:
+        return None
+    infos = page.get_image_info(xrefs=True)
+    if len(infos) != 1 or not infos[0]["xref"]:
+        return None
+    info = infos[0]
+    a, b, c, d, _, _ = info["transform"]
+    if b or c or a <= 0 or d <= 0 or abs(pymupdf.Rect(info["bbox"])) < 0.9 * abs(page.rect):
+        return None
+    doc, xref = page.parent, info["xref"]
+    if (
+        doc.xref_get_key(xref, "Filter") != ("name", "/DCTDecode")
+        or doc.xref_get_key(xref, "SMask")[0] != "null"
+        or doc.xref_get_key(xref, "Decode")[0] != "null"
+        or info["colorspace"] not in (1, 3)
+        or info["bpc"] != 8
+        or page.get_drawings()
+    ):
+        return None
+    return doc.xref_stream_raw(xref)
+
+
+def page_image(page: pymupdf.Page, dpi: int, text: str):
+    # Scanned pages skip rendering: their JPEG goes out as-is when small enough,
+    # otherwise it is decoded at a reduced DCT scale. Everything else is rendered.
+    raw = embedded_jpeg(page, text)
+    if raw is not None:
+        img = Image.open(io.BytesIO(raw))
+        if max(img.size) <= MAX_IMAGE_SIZE:
+            img.close()
+            return raw
+        scale = MAX_IMAGE_SIZE / max(img.size)
+        img.draft(img.mode, (round(img.width * scale), round(img.height * scale)))
+        return img
+    # Render straight at the size OCR needs instead of downscaling afterwards
+    zoom = min(dpi / 72, MAX_IMAGE_SIZE / max(page.rect.width, page.rect.height))
+    pix = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+    return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+
 def process_pdf_from_zip(zipf, info, service, year, zip_key, manifest):
     pdf_name = Path(info.filename).name
 
-    if pdf_name in GLOBAL_FINISHED_FILES:
+    if is_done(pdf_name):
         print(f"[SKIP][MANIFEST] {pdf_name}")
         return
 
@@ -135,73 +477,88 @@ def process_pdf_from_zip(zipf, info, service, year, zip_key, manifest):
         return
 
     try:
-        with tempfile.TemporaryDirectory() as tmp:
-            tmp_pdf = Path(tmp) / pdf_name
-            with zipf.open(info) as src, open(tmp_pdf, "wb") as dst:
-                shutil.copyfileobj(src, dst)
+        # Open the PDF straight from the zip member, no temp file
+        with zipf.open(info) as src:
+            data = src.read()
+            digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+            if copy_duplicate(service, digest, pdf_name, c_path):
+                print(f"[SKIP][DUP]      {pdf_name}")
+                add_manifest(manifest, service, year, zip_key, pdf_name)
+                mark_done(pdf_name)
+                return
 
             try:
-                total_pages = int(pdfinfo_from_path(str(tmp_pdf))["Pages"])
+                doc = pymupdf.open(stream=data, filetype="pdf")
+                total_pages = doc.page_count
             except Exception:
                 print(f"[ERR][BAD_PDF]  {pdf_name}")
                 return
 
             if total_pages > MAX_PAGES:
                 print(f"[SKIP][PAGES]   {pdf_name} ({total_pages} pgs)")
+                doc.close()
                 return
 
             print(f"[OCR] {pdf_name} ({total_pages} pages)")
             pdf_start = time.perf_counter()
 
-            images = convert_from_path(str(tmp_pdf), dpi=IMAGE_DPI)
-
             results = [""] * total_pages
             page_times = [0.0] * total_pages
+            submitted = 0
 
-            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
-                futures = [
-                    ex.submit(ocr_worker, (img, i, total_pages))
-                    for i, img in enumerate(images)
-                ]
-                for f in as_completed(futures):
-                    idx, text, t_page = f.result()
+            done_q = Queue()
+            queues, threads = start_endpoint_workers(done_q)
+            try:
+                with doc:
+                    # One parse of the PDF; each page goes to OCR as soon as it is rendered
+                    for i, page in enumerate(doc):
+                        raw_text = page.get_text("text").strip()
+                        results[i] = text_layer(raw_text)
+                        if results[i]:
+                            continue
+                        img = page_image(page, choose_dpi(page), raw_text)
+                        # Blocks once every endpoint queue is full, so at most
+                        # ENDPOINT_QUEUE_SIZE pages per endpoint wait in RAM
+                        submit_page(queues, (img, i, total_pages), submitted)
+                        submitted += 1
+                if submitted < total_pages:
+                    print(f"\t└─ Text layer: {total_pages - submitted}/{total_pages} pages")
+                for _ in range(submitted):
+                    r = done_q.get()
+                    if isinstance(r, Exception):
+                        raise r
+                    idx, text, t_page = r
                     results[idx] = text
                     page_times[idx] = t_page
                     print(f"\t└─ Page {idx+1}/{total_pages} done in {t_page:.2f}s")
-
-            for img in images:
-                img.close()
+            finally:
+                stop_endpoint_workers(queues, threads)
 
             total_dt = time.perf_counter() - pdf_start
             avg_per_page = total_dt / total_pages if total_pages else 0
 
-            c_path.write_text(
-                json.dumps(
+            c_path.write_bytes(
+                orjson.dumps(
                     {
                         "filename": pdf_name,
                         "pages": total_pages,
                         "text": "\n\n".join(results),
                         "time_sec": round(total_dt, 2),
                     },
-                    ensure_ascii=False,
-                    indent=2,
-                ),
-                encoding="utf-8",
+                    option=orjson.OPT_INDENT_2,
+                )
             )
 
-            z = manifest["zips"].setdefault(zip_key, {"count": 0, "files": []})
-            if pdf_name not in z["files"]:
-                z["files"].append(pdf_name)
-                z["count"] = len(z["files"])
+            link_hash(service, digest, c_path)
+            add_manifest(manifest, service, year, zip_key, pdf_name)
 
-            GLOBAL_FINISHED_FILES.add(pdf_name)
+            mark_done(pdf_name)
 
             print(
                 f"  Finished {pdf_name} | "
                 f"Total: {total_dt:.2f}s | "
                 f"Avg: {avg_per_page:.2f}s/page"
             )
-            gc.collect()
 
     except zipfile.BadZipFile:
         print(f"[ERR][BAD_ZIP]   {pdf_name}")
@@ -216,11 +573,13 @@ def process_zip(zip_path: Path, service: str):
     zip_key = zip_path.name
 
     with zipfile.ZipFile(zip_path) as z:
-        for info in z.infolist():
+        # Walk members in on-disk order so reads stay sequential
+        for info in sorted(z.infolist(), key=lambda i: i.header_offset):
             if not info.is_dir() and info.filename.lower().endswith(".pdf"):
                 process_pdf_from_zip(z, info, service, year, zip_key, manifest)
 
     save_manifest(service, year, manifest)
+    gc.collect()  # once per zip; page images are freed by refcounting
 
 
 def main():
@@ -1,20 +1,29 @@
 import os
-import json
+import orjson
+import hashlib
+import diskcache
 import zipfile
 import tempfile
 import time
 import io
-import base64
+import binascii
 import requests
-import gc
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 import shutil
-from itertools import cycle
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
 
 from pdf2image import convert_from_path, pdfinfo_from_path
 from PIL import Image
 
+try:
+    import pyvips
+except (ImportError, OSError):  # pyvips or libvips missing, fall back to Pillow
+    pyvips = None
+
 # --- Configurations ---
 ZIP_ROOT = Path(os.getenv("ZIP_ROOT", "zip"))
 OCR_ROOT = Path(os.getenv("OCR_ROOT", "ocr"))
@@ -22,14 +31,68 @@ SERVICE = os.getenv("SERVICE", "ratchakitcha")
 TARGET_YEAR = os.getenv("TARGET_YEAR")
 
 MAX_PAGES = 100
-IMAGE_DPI = 200
+RENDER_CHUNK = 10  # pages per pdftoppm run
+RENDER_THREADS = min(4, os.cpu_count() or 1)
 MAX_IMAGE_SIZE = 1024
 
 OLLAMA_URLS = ["http://localhost:11434"]
 OLLAMA_MODEL = "scb10x/typhoon-ocr1.5-3b"
-REQUEST_DELAY_SEC = float(os.getenv("REQUEST_DELAY_SEC", "1.5")) 
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+REQUEST_DELAY_SEC = float(os.getenv("REQUEST_DELAY_SEC", "0"))  # min gap between request starts
+# Pages in OCR at once; match the server's OLLAMA_NUM_PARALLEL
+OCR_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))
+
+_manifests = {}  # (service, year) -> manifest, kept for the whole run
+
+def ollama_session(pool_size: int) -> requests.Session:
+    s = requests.Session()
+    s.mount("http://", HTTPAdapter(
+        pool_maxsize=pool_size,
+        # Backoff spans an Ollama restart by the watchdog (0s, 10s, 20s)
+        max_retries=Retry(
+            total=3, backoff_factor=5, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=None
+        ),
+    ))
+    return s
+
+# One keep-alive connection pool per Ollama endpoint
+SESSIONS = {url: ollama_session(OCR_PARALLEL) for url in OLLAMA_URLS}
+
+# Page-level OCR results keyed by image hash; repeated cover pages skip Ollama
+PAGE_CACHE = diskcache.Cache(str(OCR_ROOT / "page_cache"))
+
+class RateLimiter:
+    # Spaces request starts at least 1/rps apart across threads; rps <= 0 disables it
+    def __init__(self, rps: float):
+        self.min_interval = 1 / rps if rps > 0 else 0.0
+        self.lock = Lock()
+        self.next_at = 0.0
+
+    def acquire(self):
+        if not self.min_interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.min_interval
+        if wait > 0:
+            time.sleep(wait)
+
+limiter = RateLimiter(1 / REQUEST_DELAY_SEC if REQUEST_DELAY_SEC > 0 else 0)
+
+# Requests in flight per endpoint; each page goes to the least-loaded one
+_inflight = {url: 0 for url in OLLAMA_URLS}
+_router_lock = Lock()
 
-ollama_pool = cycle(OLLAMA_URLS)
+def acquire_endpoint() -> str:
+    with _router_lock:
+        url = min(_inflight, key=_inflight.get)
+        _inflight[url] += 1
+        return url
+
+def release_endpoint(url: str):
+    with _router_lock:
+        _inflight[url] -= 1
 
 def buddhist_to_ad(year: str) -> str:
     y = int(year)
@@ -48,109 +111,212 @@ def manifest_path(service: str, year: str) -> Path:
     p.mkdir(parents=True, exist_ok=True)
     return p / "manifest.json"
 
+def manifest_log_path(service: str, year: str) -> Path:
+    # Append-only journal of manifest additions, folded into manifest.json on save
+    return manifest_path(service, year).with_suffix(".jsonl")
+
 def load_manifest(service: str, year: str) -> dict:
     p = manifest_path(service, year)
+    manifest = {"schema_version": 1, "generated_at": None, "zips": {}}
     if p.exists():
         try:
-            return json.loads(p.read_text(encoding="utf-8"))
+            manifest = orjson.loads(p.read_bytes())
         except: pass
-    return {"schema_version": 1, "generated_at": None, "zips": {}}
+    # In-memory index for O(1) lookups; never written to disk
+    for z in manifest["zips"].values():
+        z["_fileset"] = set(z["files"])
+    log = manifest_log_path(service, year)
+    if log.exists():
+        for line in log.read_bytes().splitlines():
+            try:
+                rec = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                continue  # torn write from an interrupted run
+            _add_manifest_entry(manifest, rec["zip"], rec["pdf"])
+    return manifest
+
+def manifest_bytes(manifest: dict) -> bytes:
+    zips = {
+        name: {k: v for k, v in z.items() if k != "_fileset"}
+        for name, z in manifest["zips"].items()
+    }
+    return orjson.dumps({**manifest, "zips": zips}, option=orjson.OPT_INDENT_2)
 
 def save_manifest(service: str, year: str, manifest: dict):
     manifest["generated_at"] = datetime.utcnow().isoformat() + "Z"
-    manifest_path(service, year).write_text(
-        json.dumps(manifest, ensure_ascii=False, indent=2),
-        encoding="utf-8"
-    )
+    p = manifest_path(service, year)
+    tmp = p.with_suffix(".json.tmp")
+    tmp.write_bytes(manifest_bytes(manifest))
+    os.replace(tmp, p)
+    manifest_log_path(service, year).unlink(missing_ok=True)
 
 def in_manifest(manifest, zip_name, pdf_name):
-    return zip_name in manifest["zips"] and pdf_name in manifest["zips"][zip_name]["files"]
+    return zip_name in manifest["zips"] and pdf_name in manifest["zips"][zip_name]["_fileset"]
+
+def _add_manifest_entry(manifest, zip_name, pdf_name) -> bool:
+    z = manifest["zips"].setdefault(zip_name, {"count": 0, "files": [], "_fileset": set()})
+    if pdf_name in z["_fileset"]:
+        return False
+    z["_fileset"].add(pdf_name)
+    z["files"].append(pdf_name)
+    z["count"] = len(z["files"])
+    return True
+
+def add_manifest(manifest, service, year, zip_name, pdf_name):
+    if not _add_manifest_entry(manifest, zip_name, pdf_name): return
+    line = orjson.dumps({
+        "zip": zip_name,
+        "pdf": pdf_name,
+        "ts": datetime.utcnow().isoformat() + "Z"
+    }) + b"\n"
+    # O_APPEND keeps single small writes atomic on POSIX
+    fd = os.open(manifest_log_path(service, year), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
 
-def add_manifest(manifest, zip_name, pdf_name):
-    z = manifest["zips"].setdefault(zip_name, {"count": 0, "files": []})
-    if pdf_name not in z["files"]:
-        z["files"].append(pdf_name)
-        z["count"] = len(z["files"])
+def cached_names(service, year) -> set:
+    with os.scandir(cache_dir(service, year)) as it:
+        return {e.name[:-5] for e in it if e.name.endswith(".json")}
 
 def load_cache(service, year, pdf_name):
     p = cache_path(service, year, pdf_name)
     if not p.exists(): return None
     try:
-        return json.loads(p.read_text(encoding="utf-8"))
+        return orjson.loads(p.read_bytes())
     except: return None
 
 def save_cache(service, year, pdf_name, data):
-    cache_path(service, year, pdf_name).write_text(
-        json.dumps(data, ensure_ascii=False, indent=2),
-        encoding="utf-8"
+    cache_path(service, year, pdf_name).write_bytes(
+        orjson.dumps(data, option=orjson.OPT_INDENT_2)
     )
 
-def ocr_single_image(img: Image.Image) -> str:
-    base_url = next(ollama_pool)
-    api_url = f"{base_url}/api/generate"
+def checkpoint_path(service, year, pdf_name) -> Path:
+    p = cache_dir(service, year) / "_ckpt"
+    p.mkdir(exist_ok=True)
+    return p / f"{pdf_name}.jsonl"
 
-    system_instruction = (
-        "Extract all text from the image and format as Markdown.\n"
-        "- Tables: Render in clean HTML <table>.\n"
-        "- Checkboxes: Use ☐ or ☑.\n"
-        "- Output: Return only the extracted content, no explanations."
-    )
+def load_checkpoint(service, year, pdf_name) -> dict:
+    p = checkpoint_path(service, year, pdf_name)
+    done = {}
+    if not p.exists(): return done
+    for line in p.read_bytes().splitlines():
+        try:
+            rec = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            continue  # torn write from an interrupted run
+        done[rec["page"]] = rec["text"]
+    return done
 
-    if max(img.size) > MAX_IMAGE_SIZE:
-        img.thumbnail((MAX_IMAGE_SIZE, MAX_IMAGE_SIZE), Image.Resampling.LANCZOS)
+def append_checkpoint(service, year, pdf_name, page, text):
+    with open(checkpoint_path(service, year, pdf_name), "ab") as f:
+        f.write(orjson.dumps({"page": page, "text": text}) + b"\n")
 
+def encode_jpeg_b64(img: Image.Image, max_size: int, quality: int) -> bytes:
     if img.mode != "RGB":
         img = img.convert("RGB")
-
-    buf = io.BytesIO()
-    img.save(buf, format="JPEG", quality=75)
-    encoded = base64.b64encode(buf.getvalue()).decode()
-    buf.close()
-
-    payload = {
-        "model": OLLAMA_MODEL,
-        "prompt": f"<image>\n{system_instruction}\n\nContent:",
-        "images": [encoded],
-        "stream": False,
-        "options": {
-            "temperature": 0,
-            "num_predict": 2048,
-            "num_ctx": 4096, 
-            "repeat_penalty": 1.1,
-        }
+    if pyvips is not None:
+        # libvips resize + libjpeg-turbo encode, no Pillow LANCZOS pass
+        vimg = pyvips.Image.new_from_memory(img.tobytes(), img.width, img.height, 3, "uchar")
+        if max(img.size) > max_size:
+            vimg = vimg.thumbnail_image(max_size, height=max_size)
+        data = vimg.jpegsave_buffer(Q=quality, optimize_coding=True, strip=True)
+    else:
+        if max(img.size) > max_size:
+            img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=quality)
+        data = buf.getbuffer()
+    return binascii.b2a_base64(data, newline=False)
+
+
+def encode_jpeg_file_b64(path: str, max_size: int, quality: int) -> bytes:
+    # pdftoppm already wrote a JPEG at OCR size; send its bytes without re-encoding
+    with Image.open(path) as img:  # header only, no decode
+        if max(img.size) > max_size:
+            return encode_jpeg_b64(img, max_size, quality)
+    with open(path, "rb") as f:
+        return binascii.b2a_base64(f.read(), newline=False)
+
+def ollama_body(payload: dict, image_b64: bytes) -> bytes:
+    # splice the base64 image in as raw bytes so it never round-trips through str
+    body = orjson.dumps({**payload, "images": ["\0"]})
+    return body.replace(b'["\\u0000"]', b'["' + image_b64 + b'"]', 1)
+
+def page_key(image_b64: bytes) -> bytes:
+    h = hashlib.blake2b(PAGE_KEY_PREFIX, digest_size=16)
+    h.update(image_b64)
+    return h.digest()
+
+
+SYSTEM_INSTRUCTION = (
+    "Extract all text from the image and format as Markdown.\n"
+    "- Tables: Render in clean HTML <table>.\n"
+    "- Checkboxes: Use ☐ or ☑.\n"
+    "- Output: Return only the extracted content, no explanations."
+)
+
+# Static part of every OCR request; only the image changes per page
+OCR_PAYLOAD = {
+    "model": OLLAMA_MODEL,
+    "prompt": f"<image>\n{SYSTEM_INSTRUCTION}\n\nContent:",
+    "stream": False,
+    "keep_alive": OLLAMA_KEEP_ALIVE,
+    "options": {
+        "temperature": 0,
+        "num_predict": 1024,  # pages are capped at MAX_IMAGE_SIZE (1024px)
+        "num_ctx": 4096,
+        "repeat_penalty": 1.1,
     }
+}
 
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            r = requests.post(api_url, json=payload, timeout=300)
-            r.raise_for_status()
-            return r.json().get("response", "").strip()
-        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
-            if attempt < max_retries - 1:
-                print(f" [!] Ollama connection failed, retrying in 10s... ({attempt+1}/{max_retries})")
-                time.sleep(10)
-                continue
-            else:
-                print(f" [ERR] Ollama is down: {e}")
-                return ""
-        except Exception as e:
-            print(f" [ERR] Unexpected Error: {e}")
-            return ""
-        finally:
-            time.sleep(REQUEST_DELAY_SEC)
+# Model, prompt and options all shape the output, so all of them key the shared page cache
+PAGE_KEY_PREFIX = orjson.dumps({k: OCR_PAYLOAD[k] for k in ("model", "prompt", "options")})
+
+def ocr_single_image(path: str) -> str:
+    encoded = encode_jpeg_file_b64(path, max_size=MAX_IMAGE_SIZE, quality=70)
+    key = page_key(encoded)
+    hit = PAGE_CACHE.get(key)
+    if hit is not None:
+        return hit
 
-def process_pdf_from_zip(zipf, info, service, year, zip_key, manifest):
+    body = ollama_body(OCR_PAYLOAD, encoded)
+    base_url = acquire_endpoint()
+    api_url = f"{base_url}/api/generate"
+    try:
+        # Connection errors and 5xx are retried by the session's Retry
+        limiter.acquire()
+        r = SESSIONS[base_url].post(api_url, data=body, headers={"Content-Type": "application/json"}, timeout=(5, 300))
+        r.raise_for_status()
+        text = r.json().get("response", "").strip()
+        if text:  # an empty reply may be transient; don't cache it for good
+            PAGE_CACHE.set(key, text)
+        return text
+    finally:
+        # Errors propagate: a failed page must not look like a blank one
+        release_endpoint(base_url)
+
+def ocr_page(service, year, pdf_name, page, path) -> str:
+    try:
+        text = ocr_single_image(path)
+    finally:
+        os.remove(path)
+    # Only reached when OCR succeeded; a blank page is done too and is not redone
+    append_checkpoint(service, year, pdf_name, page, text)
+    return text
+
+def process_pdf_from_zip(zipf, info, service, year, zip_key, manifest, known):
     pdf_name = Path(info.filename).name
     if in_manifest(manifest, zip_key, pdf_name): return
-    if load_cache(service, year, pdf_name):
-        add_manifest(manifest, zip_key, pdf_name)
+    if pdf_name in known:
+        add_manifest(manifest, service, year, zip_key, pdf_name)
         return
 
     with tempfile.TemporaryDirectory() as tmp:
         tmp_pdf = Path(tmp) / pdf_name
         with zipf.open(info) as src, open(tmp_pdf, "wb") as dst:
-            shutil.copyfileobj(src, dst)
+            shutil.copyfileobj(src, dst, length=1 << 20)  # 1 MiB reads, not 64 KiB
 
         try:
             info_dict = pdfinfo_from_path(str(tmp_pdf))
@@ -164,35 +330,57 @@ def process_pdf_from_zip(zipf, info, service, year, zip_key, manifest):
             return
 
         print(f"[OCR] {pdf_name} ({total_pages} pages)")
-        texts = []
+        done = load_checkpoint(service, year, pdf_name)
+        if done:
+            print(f"\t resume: {len(done)}/{total_pages} pages from checkpoint")
+        texts = dict(done)
+        failed = False
         start = time.perf_counter()
 
-        for page in range(1, total_pages + 1):
-            print(f"\t- page {page}/{total_pages}")
-            try:
-                images = convert_from_path(
-                    str(tmp_pdf),
-                    dpi=IMAGE_DPI,
-                    first_page=page,
-                    last_page=page,
-                    thread_count=1
-                )
-
-                if images:
-                    text = ocr_single_image(images[0])
-                    if text:
-                        texts.append(text)
-                    images[0].close()
-                    del images
-                
-                gc.collect()
-
-            except Exception as e:
-                print(f"\t [ERR] page {page}: {e}")
-                break
+        # pdftoppm renders the next window while earlier pages are in OCR
+        with ThreadPoolExecutor(max_workers=OCR_PARALLEL) as pool:
+            futures = {}
+            for first in range(1, total_pages + 1, RENDER_CHUNK):
+                last = min(first + RENDER_CHUNK - 1, total_pages)
+                if all(p in done for p in range(first, last + 1)):
+                    continue
+                try:
+                    # One pdftoppm run per window, pages land on disk instead of RAM
+                    paths = convert_from_path(
+                        str(tmp_pdf),
+                        size=MAX_IMAGE_SIZE,  # pdftoppm -scale-to, long side in px
+                        first_page=first,
+                        last_page=last,
+                        output_folder=tmp,
+                        fmt="jpeg",
+                        jpegopt={"quality": 70, "progressive": False, "optimize": False},
+                        paths_only=True,
+                        thread_count=RENDER_THREADS
+                    )
+                except Exception as e:
+                    print(f"\t [ERR] pages {first}-{last}: {e}")
+                    failed = True
+                    break
+
+                for page, path in zip(range(first, last + 1), paths):
+                    if page in done:
+                        os.remove(path)
+                        continue
+                    print(f"\t- page {page}/{total_pages}")
+                    futures[pool.submit(ocr_page, service, year, pdf_name, page, path)] = page
+
+            for f in as_completed(futures):
+                page = futures[f]
+                try:
+                    texts[page] = f.result()
+                except Exception as e:
+                    print(f"\t [ERR] page {page}: {e}")
+                    failed = True
+
+        if failed: return  # keep the checkpoint, resume on the next run
 
         duration = round(time.perf_counter() - start, 2)
-        full_text = "\n\n".join(texts).strip()
+        full_text = "\n\n".join(texts[p] for p in sorted(texts) if texts[p]).strip()
         
         if full_text:
             save_cache(service, year, pdf_name, {
@@ -201,20 +389,29 @@ def process_pdf_from_zip(zipf, info, service, year, zip_key, manifest):
                 "text": full_text,
                 "time_sec": duration
             })
-            add_manifest(manifest, zip_key, pdf_name)
+            known.add(pdf_name)
+            add_manifest(manifest, service, year, zip_key, pdf_name)
+        checkpoint_path(service, year, pdf_name).unlink(missing_ok=True)
 
 def process_zip(zip_path: Path, service: str):
     raw_year = zip_path.stem
     year = buddhist_to_ad(raw_year) if service == "ratchakitcha" else raw_year
     zip_key = zip_path.name
-    manifest = load_manifest(service, year)
-
-    with zipfile.ZipFile(zip_path) as z:
-        for info in z.infolist():
-            if info.is_dir() or not info.filename.lower().endswith(".pdf"):
-                continue
-            process_pdf_from_zip(z, info, service, year, zip_key, manifest)
-            save_manifest(service, year, manifest)
+    if (service, year) not in _manifests:
+        _manifests[service, year] = load_manifest(service, year)
+    manifest = _manifests[service, year]
+    known = cached_names(service, year)
+
+    try:
+        with zipfile.ZipFile(zip_path) as z:
+            # Walk members in on-disk order so reads stay sequential
+            for info in sorted(z.infolist(), key=lambda i: i.header_offset):
+                if info.is_dir() or not info.filename.lower().endswith(".pdf"):
+                    continue
+                process_pdf_from_zip(z, info, service, year, zip_key, manifest, known)
+    finally:
+        # Once per zip, and still on a crash or Ctrl-C mid-zip
+        save_manifest(service, year, manifest)
 
 def main():
     service_dir = ZIP_ROOT / SERVICE
@@ -43,12 +43,12 @@ def zip_cache(
 
         print(f"\n[ZIP] {zip_name}")
 
-        existing = set()
-        if os.path.exists(zip_path):
-            with zipfile.ZipFile(zip_path, "r") as z:
-                existing = set(z.namelist())
-
-        with zipfile.ZipFile(zip_path, "a", zipfile.ZIP_DEFLATED) as z:
+        # zlib level 1: several times faster than the default 6 on short JSON
+        with zipfile.ZipFile(
+            zip_path, "a", zipfile.ZIP_DEFLATED, compresslevel=1, strict_timestamps=False
+        ) as z:
+            # "a" mode has already read the central directory; no second open
+            existing = set(z.namelist())
             for fname in sorted(files):
                 if fname in existing:
                     continue
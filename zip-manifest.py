@@ -1,9 +1,20 @@
 import os
-import json
+import orjson
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 
+def scan_zip(zip_path: str):
+    try:
+        with zipfile.ZipFile(zip_path, "r") as z:
+            # Directory entries end with "/", so the suffix test excludes them
+            files = [n[:-5] for n in z.namelist() if n.endswith(".pdf.json")]  # strip .json
+    except zipfile.BadZipFile:
+        return None
+    return sorted(set(files))
+
+
 def build_manifest(zip_dir: str) -> dict:
     manifest = {
         "schema_version": 1,
@@ -11,33 +22,24 @@ def build_manifest(zip_dir: str) -> dict:
         "zips": {}
     }
 
-    for fname in sorted(os.listdir(zip_dir)):
-        if not fname.endswith(".zip"):
-            continue
-
-        zip_path = os.path.join(zip_dir, fname)
-        files = []
+    names = sorted(f for f in os.listdir(zip_dir) if f.endswith(".zip"))
 
-        try:
-            with zipfile.ZipFile(zip_path, "r") as z:
-                for m in z.infolist():
-                    if m.is_dir():
-                        continue
-                    if not m.filename.endswith(".pdf.json"):
-                        continue
-                    files.append(m.filename[:-5])  # strip .json
-        except zipfile.BadZipFile:
-            print(f"[WARN] bad zip: {fname}")
-            continue
+    # Central-directory reads are I/O bound, so threads overlap them;
+    # map() keeps the results in name order
+    with ThreadPoolExecutor(os.cpu_count()) as ex:
+        results = ex.map(scan_zip, (os.path.join(zip_dir, f) for f in names))
 
-        files = sorted(set(files))
+        for fname, files in zip(names, results):
+            if files is None:
+                print(f"[WARN] bad zip: {fname}")
+                continue
 
-        manifest["zips"][fname] = {
-            "count": len(files),
-            "files": files
-        }
+            manifest["zips"][fname] = {
+                "count": len(files),
+                "files": files
+            }
 
-        print(f"[OK] {fname}: {len(files)} files")
+            print(f"[OK] {fname}: {len(files)} files")
 
     return manifest
 
@@ -50,7 +52,7 @@ if __name__ == "__main__":
 
     manifest = build_manifest(zip_dir)
 
-    with open(out, "w", encoding="utf-8") as f:
-        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    with open(out, "wb") as f:
+        f.write(orjson.dumps(manifest, option=orjson.OPT_INDENT_2))
 
     print(f"\nManifest written: {out}")